@@ -1,7 +1,104 @@
 # analytics.py - Functional programming for habit analytics
+import array
+import bisect
 import datetime
+import analytics_jit
 from habit import Habit
 
+# NumPy is optional - without it the plain Python loops are used
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Daily histories with at least this many dates use the Numba/NumPy path
+NUMPY_MIN_DATES = 1000
+
+# Below this many completions sorted(set(...)) is the quickest dedupe
+DEDUPE_BY_SET_MAX = 150
+
+
+def _use_fast_path(values):
+    """
+    True if a history is long enough for the compiled or NumPy path.
+    """
+    return np is not None and len(values) >= NUMPY_MIN_DATES
+
+
+def _to_ordinals(unique_dates):
+    """
+    Turn a list of dates into a NumPy int64 array of ordinal days.
+    """
+    return np.fromiter(
+        (d.toordinal() for d in unique_dates), dtype=np.int64, count=len(unique_dates)
+    )
+
+
+def _leading_run_np(ords_desc):
+    """
+    Length of the leading run of consecutive numbers in a newest->oldest array.
+    """
+    consecutive = np.diff(ords_desc) == -1
+    if consecutive.all():
+        return len(ords_desc)
+    # argmin finds the first gap
+    return 1 + int(np.argmin(consecutive))
+
+
+def _longest_run_np(ords_desc):
+    """
+    Length of the longest run of consecutive numbers in a newest->oldest array.
+    """
+    consecutive = np.diff(ords_desc) == -1
+    # Start/end positions of each run of True values
+    edges = np.flatnonzero(np.diff(np.r_[0, consecutive.astype(np.int8), 0]))
+    runs = edges[1::2] - edges[::2]
+    return int(runs.max()) + 1 if runs.size else 1
+
+
+def _ordinal_array(unique_dates):
+    """
+    Pack dates into a compact array of ordinal day numbers.
+    """
+    return array.array('l', (d.toordinal() for d in unique_dates))
+
+
+def _dedupe_desc(values):
+    """
+    Drop repeats from a list that is already sorted newest->oldest.
+    Repeats sit next to each other, so one linear pass is enough.
+    """
+    unique = []
+    for value in values:
+        if not unique or unique[-1] != value:
+            unique.append(value)
+    return unique
+
+
+def _unique_dates_desc(dates):
+    """
+    Unique calendar dates of some completions, newest first.
+
+    Short histories use sorted(set(...)). Longer ones dedupe with dict.fromkeys,
+    which keeps the newest-first order from the database, so the sort only
+    has to check one already-ordered run (unsorted input still sorts fine).
+    """
+    if len(dates) < DEDUPE_BY_SET_MAX:
+        return sorted({d.date() for d in dates}, reverse=True)
+    return sorted(dict.fromkeys([d.date() for d in dates]), reverse=True)
+
+
+def _week_index(day):
+    """
+    Number the calendar week (Monday to Sunday) a date falls in.
+
+    Ordinal day 1 (0001-01-01) is a Monday, so this groups dates exactly
+    like ISO weeks, but as one int where consecutive weeks differ by 1,
+    including across a new year.
+    """
+    return (day.toordinal() - 1) // 7
+
+
 # Helper function for calculating streaks
 def calculate_streak(dates, schedule):
     """
@@ -17,7 +114,7 @@ def calculate_streak(dates, schedule):
         return 0
 
     # Convert timestamps to dates and remove duplicates
-    unique_dates = sorted({d.date() for d in dates}, reverse=True)
+    unique_dates = _unique_dates_desc(dates)
 
     # Daily streak logic
     if schedule == "daily":
@@ -25,10 +122,16 @@ def calculate_streak(dates, schedule):
         # If last completion is before yesterday, streak is 0
         if unique_dates[0] < today - datetime.timedelta(days=1):
             return 0
+        if _use_fast_path(unique_dates):
+            if analytics_jit.HAVE_NUMBA:
+                return analytics_jit.streak_scan(_to_ordinals(unique_dates), today.toordinal())[0]
+            return _leading_run_np(_to_ordinals(unique_dates))
+        # Compare plain day numbers instead of subtracting dates
+        ords = _ordinal_array(unique_dates)
         # Start streak count
         streak = 1
-        for previous, current in zip(unique_dates, unique_dates[1:]):
-            if (previous - current).days == 1:
+        for i in range(len(ords) - 1):
+            if ords[i] - ords[i + 1] == 1:
                 streak += 1
             else:
                 break
@@ -40,12 +143,11 @@ def calculate_streak(dates, schedule):
         # If no completion in last 7 days, streak is 0
         if (today - unique_dates[0]).days > 7:
             return 0
-        # Group by ISO calendar week
-        weeks = sorted({d.isocalendar()[:2] for d in unique_dates}, reverse=True)
+        # Group by calendar week
+        weeks = _dedupe_desc([_week_index(d) for d in unique_dates])
         streak = 1
         for prev_week, curr_week in zip(weeks, weeks[1:]):
-            # Compare year and week number
-            if prev_week[0] == curr_week[0] and prev_week[1] - curr_week[1] == 1:
+            if prev_week - curr_week == 1:
                 streak += 1
             else:
                 break
@@ -66,16 +168,29 @@ def get_longest_streak_for_habit(habit: Habit, completions: list):
     """
     Compute the longest streak ever achieved for a habit.
     """
+    return _longest_streak(completions, habit.schedule)
+
+
+def _longest_streak(completions, schedule):
+    """
+    Scan completions for the longest run of consecutive days or weeks.
+    """
     # Convert to unique sorted dates oldest->newest
-    unique_dates = sorted({d.date() for d in completions})
+    unique_dates = _unique_dates_desc(completions)[::-1]
     if not unique_dates:
         return 0
 
     # Daily longest logic
-    if habit.schedule == "daily":
+    if schedule == "daily":
+        if _use_fast_path(unique_dates):
+            ords_desc = _to_ordinals(unique_dates[::-1])
+            if analytics_jit.HAVE_NUMBA:
+                return analytics_jit.streak_scan(ords_desc, ords_desc[0])[1]
+            return _longest_run_np(ords_desc)
+        ords = _ordinal_array(unique_dates)
         longest = current = 1
-        for prev, curr in zip(unique_dates, unique_dates[1:]):
-            if (curr - prev).days == 1:
+        for i in range(len(ords) - 1):
+            if ords[i + 1] - ords[i] == 1:
                 current += 1
                 longest = max(longest, current)
             else:
@@ -83,12 +198,12 @@ def get_longest_streak_for_habit(habit: Habit, completions: list):
         return longest
 
     # Weekly longest logic
-    if habit.schedule == "weekly":
-        # Group by ISO week
-        weeks = sorted({d.isocalendar()[:2] for d in unique_dates})
+    if schedule == "weekly":
+        # Group by calendar week
+        weeks = _dedupe_desc([_week_index(d) for d in reversed(unique_dates)])[::-1]
         longest = current = 1
         for prev_week, curr_week in zip(weeks, weeks[1:]):
-            if prev_week[0] == curr_week[0] and curr_week[1] - prev_week[1] == 1:
+            if curr_week - prev_week == 1:
                 current += 1
                 longest = max(longest, current)
             else:
@@ -96,7 +211,76 @@ def get_longest_streak_for_habit(habit: Habit, completions: list):
         return longest
 
     # Should not reach here due to validation
-    raise ValueError(f"Unknown schedule: {habit.schedule}")
+    raise ValueError(f"Unknown schedule: {schedule}")
+
+
+def _runs_desc(keys):
+    """
+    Walk unique day/week numbers, newest first, in one pass.
+
+    Returns (first run, longest run) where a run is consecutive numbers.
+    The first run is the current streak if the newest one is recent enough.
+    """
+    if not keys:
+        return 0, 0
+    if _use_fast_path(keys):
+        ords_desc = np.asarray(keys, dtype=np.int64)
+        if analytics_jit.HAVE_NUMBA:
+            # Passing the newest number as "today" makes the first run count
+            return analytics_jit.streak_scan(ords_desc, ords_desc[0])
+        return _leading_run_np(ords_desc), _longest_run_np(ords_desc)
+    run = longest = 1
+    first = None
+    for newer, older in zip(keys, keys[1:]):
+        if newer - older == 1:
+            run += 1
+            longest = max(longest, run)
+        else:
+            if first is None:
+                first = run
+            run = 1
+    if first is None:
+        first = run
+    return first, longest
+
+
+def _expected_completions(schedule, period_start, period_end):
+    """
+    How many completions a habit should have in [period_start, period_end].
+    """
+    days = (period_end - period_start).days + 1
+    return days if schedule == "daily" else (days // 7 + 1)
+
+
+def streaks_from_periods(schedule, keys_desc, last_day):
+    """
+    Current and longest streak from unique day ordinals (daily) or week
+    numbers (weekly), newest first - the form kept in the completion_days
+    and completion_weeks tables.
+
+    Args:
+        schedule (str): 'daily' or 'weekly'.
+        keys_desc (list of int): Day ordinals or week numbers, newest first.
+        last_day (datetime.date): Day of the newest completion.
+    Returns:
+        tuple: (current_streak, longest_streak)
+    """
+    if not keys_desc:
+        return 0, 0
+    today = datetime.date.today()
+    if schedule == "daily":
+        # Current streak only counts if the last completion was today or yesterday
+        recent = last_day >= today - datetime.timedelta(days=1)
+    elif schedule == "weekly":
+        # ... or within the last 7 days for weekly habits
+        recent = (today - last_day).days <= 7
+    else:
+        # Should not reach here due to validation
+        raise ValueError(f"Unknown schedule: {schedule}")
+
+    # One walk: the first run is the current streak, the biggest is the longest
+    current, longest = _runs_desc(keys_desc)
+    return (current if recent else 0), longest
 
 
 def get_habits_by_periodicity(habits: list, schedule: str):
@@ -112,10 +296,27 @@ def get_habits_by_periodicity(habits: list, schedule: str):
     return [h for h in habits if h.schedule == schedule]
 
 
-def find_struggling_habits(habits: list, all_completions: dict, period_start=None, period_end=None):
+def _count_in_period(completions, period_start, period_end):
+    """
+    Count completion datetimes that fall on a day in [period_start, period_end].
+    """
+    # Timsort turns newest-first (or already sorted) input around in linear time
+    ordered = sorted(completions)
+    start = datetime.datetime.combine(period_start, datetime.time.min)
+    end = datetime.datetime.combine(period_end + datetime.timedelta(days=1), datetime.time.min)
+    # Binary search for the first completion on or after each boundary
+    return bisect.bisect_left(ordered, end) - bisect.bisect_left(ordered, start)
+
+
+def find_struggling_habits(habits: list, all_completions: dict = None, period_start=None, period_end=None,
+                           counts: dict = None):
     """
     Identify habits with most missed completions in a period.
 
+    Pass either all_completions ({name: [datetimes]}) or counts
+    ({name: completions in the period}, e.g. from one GROUP BY query).
+    With counts no completion lists are scanned.
+
     Returns a list of tuples (habit_name, missed_count), sorted descending.
     """
     if not habits:
@@ -128,15 +329,13 @@ def find_struggling_habits(habits: list, all_completions: dict, period_start=Non
 
     results = []
     for habit in habits:
-        completions = all_completions.get(habit.name, [])
-        # Count completions in range
-        count = sum(
-            1 for c in completions
-            if period_start <= c.date() <= period_end
-        )
+        if counts is not None:
+            count = counts.get(habit.name, 0)
+        else:
+            completions = (all_completions or {}).get(habit.name, [])
+            count = _count_in_period(completions, period_start, period_end)
         # Expected counts
-        days = (period_end - period_start).days + 1
-        expected = days if habit.schedule == "daily" else (days // 7 + 1)
+        expected = _expected_completions(habit.schedule, period_start, period_end)
         missed = max(0, expected - count)
         results.append((habit.name, missed))
     # Sort by most missed
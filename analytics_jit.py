@@ -0,0 +1,71 @@
+# analytics_jit.py - Compiled streak loop for very long habit histories
+#
+# Numba is optional and slow to import, so it is only imported the first time
+# streak_scan runs. HAVE_NUMBA just says whether it is installed, so analytics
+# can pick another path without paying for the import.
+import importlib.util
+
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
+
+# The function streak_scan calls; compiled (or not) on first use
+_streak_scan = None
+
+
+def _streak_scan_py(ords_desc, today_ord):
+    """
+    Work out current and longest daily streak in a single pass.
+
+    Args:
+        ords_desc: Unique ordinal days, newest first (NumPy int64 array or list).
+        today_ord (int): Ordinal of today's date.
+    Returns:
+        tuple: (current_streak, longest_streak)
+    """
+    n = len(ords_desc)
+    if n == 0:
+        return 0, 0
+
+    # Current streak only counts if the newest day is today or yesterday
+    current = 0
+    counting = today_ord - ords_desc[0] <= 1
+    run = 1
+    longest = 1
+    for i in range(n - 1):
+        if ords_desc[i] - ords_desc[i + 1] == 1:
+            run += 1
+        else:
+            if counting:
+                current = run
+                counting = False
+            run = 1
+        if run > longest:
+            longest = run
+    if counting:
+        current = run
+    return current, longest
+
+
+def _load_streak_scan():
+    """Compile _streak_scan_py with Numba, or return it as is without Numba"""
+    global HAVE_NUMBA
+    if HAVE_NUMBA:
+        try:
+            from numba import njit
+        except ImportError:
+            # Installed but broken - carry on without it
+            HAVE_NUMBA = False
+        else:
+            # cache=True stores the compiled code on disk so later runs skip compiling
+            return njit(cache=True)(_streak_scan_py)
+    return _streak_scan_py
+
+
+def streak_scan(ords_desc, today_ord):
+    """
+    Current and longest daily streak, see _streak_scan_py.
+    Numba is imported and the loop compiled on the first call.
+    """
+    global _streak_scan
+    if _streak_scan is None:
+        _streak_scan = _load_streak_scan()
+    return _streak_scan(ords_desc, today_ord)
@@ -1,132 +1,292 @@
 import sqlite3
+import contextlib
 import datetime
+import os
+import threading
 
 # Database filename
 DB_NAME = "habits.db"
 
-# Shared connection for in-memory database
-_shared_conn = None
+# Streak cache (JSON) kept next to the database file
+ANALYTICS_CACHE_NAME = "analytics_cache.json"
+
+# One long-lived connection, reused by every call while DB_NAME stays the same.
+# Kept as a single (name, connection) tuple so it can be read without the lock.
+_shared = (None, None)
+
+# The shared connection may be used from several threads. Writes take this
+# lock, so one thread's statements never end up in another thread's
+# transaction. Reads don't take it and can see another thread's uncommitted rows.
+_write_lock = threading.RLock()
+
+
+# Columns declared TIMESTAMP (or selected as "col [timestamp]") come back
+# as datetime objects. Values are stored with isoformat(), which the default
+# sqlite3 converter can't parse because of the "T" separator.
+# Binding fromisoformat as a default argument saves two attribute lookups per row.
+def _convert_timestamp(value, _fromiso=datetime.datetime.fromisoformat):
+    return _fromiso(value.decode())
+
+
+sqlite3.register_converter("timestamp", _convert_timestamp)
+
+# Let the driver run the converter for declared types and column name hints
+_DETECT_TYPES = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+
+
+# Performance settings for file-based databases
+_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",       # readers don't block the writer
+    "PRAGMA synchronous = NORMAL",     # fewer fsyncs per commit, safe with WAL
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 134217728",    # 128 MB
+    "PRAGMA cache_size = -20000",      # about 20 MB page cache
+)
+
+
+def _tune_connection(conn):
+    """
+    Apply the performance PRAGMAs. Failures are ignored because some
+    filesystems or SQLite builds don't support every setting.
+    """
+    for pragma in _PRAGMAS:
+        try:
+            conn.execute(pragma)
+        except sqlite3.Error:
+            pass
 
 
 def connect_db():
     """
-    Return a sqlite3 connection. If DB_NAME is ':memory:', reuse one global
-    in-memory connection so that tables persist across calls.
+    Return the shared sqlite3 connection for DB_NAME.
+
+    The same connection is reused across calls (so in-memory tables persist
+    and prepared statements stay cached). If DB_NAME changes, the old
+    connection is closed and a new one is opened.
     """
-    global _shared_conn
-    # Use shared connection for in-memory DB
-    if DB_NAME == ":memory:":
-        if _shared_conn is None:
-            _shared_conn = sqlite3.connect(DB_NAME)
-            _shared_conn.row_factory = sqlite3.Row
-            _shared_conn.execute("PRAGMA foreign_keys = ON")
-        return _shared_conn
+    global _shared
+    name, shared_conn = _shared
+    if shared_conn is not None and name == DB_NAME:
+        return shared_conn
 
-    # Otherwise, create a fresh file-based connection
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row  # makes rows dict-like
-        conn.execute("PRAGMA foreign_keys = ON")
+    with _write_lock:
+        # Another thread may have connected while we waited
+        name, shared_conn = _shared
+        if shared_conn is not None and name == DB_NAME:
+            return shared_conn
+        try:
+            conn = sqlite3.connect(DB_NAME, detect_types=_DETECT_TYPES, check_same_thread=False)
+            conn.row_factory = sqlite3.Row  # makes rows dict-like
+            conn.execute("PRAGMA foreign_keys = ON")
+            if DB_NAME != ":memory:":
+                _tune_connection(conn)
+        except Exception as e:
+            print(f"Database connection error: {e}")
+            raise ConnectionError(f"Couldn't connect to database: {e}")
+
+        if shared_conn is not None:
+            shared_conn.close()
+        _shared = (DB_NAME, conn)
         return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        raise ConnectionError(f"Couldn't connect to database: {e}")
+
+
+@contextlib.contextmanager
+def transaction():
+    """
+    Hold the write lock and run the with-block as one transaction on the
+    shared connection: commit at the end, roll back if anything raises.
+    Write helpers called inside should be passed commit=False.
+    """
+    with _write_lock:
+        conn = connect_db()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 
 def initialize_database():
     """
     Create tables for habits and completions if they don't exist.
     """
-    conn = connect_db()
-    # Create habits table
+    with _write_lock:
+        conn = connect_db()
+        # Create habits table
+        conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS habits (
+                name TEXT PRIMARY KEY,
+                description TEXT,
+                schedule TEXT,
+                created_on TIMESTAMP
+            )
+            '''
+        )
+        # Create completions table
+        conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS completions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                habit_name TEXT,
+                completed_on TIMESTAMP,
+                FOREIGN KEY (habit_name) REFERENCES habits(name) ON DELETE CASCADE
+            )
+            '''
+        )
+        # Completions are always looked up by habit and usually by date
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_completions_habit_date "
+            "ON completions (habit_name, completed_on)"
+        )
+        _initialize_completion_periods(conn)
+        conn.commit()
+
+
+# Day number matching Python's date.toordinal() (0001-01-01 is day 1)
+_DAY_ORD_SQL = "CAST(julianday(date({col})) - 1721424.5 AS INTEGER)"
+
+
+def _initialize_completion_periods(conn):
+    """
+    Create completion_days / completion_weeks: the distinct days and weeks
+    each habit was completed, as integers, so streaks can skip date parsing.
+    Weeks are numbered (day_ord - 1) / 7, which is Monday-based like ISO weeks.
+    A trigger keeps them in sync with completions; rows go away with their habit.
+    """
+    existing = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )}
     conn.execute(
         '''
-        CREATE TABLE IF NOT EXISTS habits (
-            name TEXT PRIMARY KEY,
-            description TEXT,
-            schedule TEXT,
-            created_on TEXT
-        )
+        CREATE TABLE IF NOT EXISTS completion_days (
+            habit_name TEXT,
+            day_ord INTEGER,
+            PRIMARY KEY (habit_name, day_ord),
+            FOREIGN KEY (habit_name) REFERENCES habits(name) ON DELETE CASCADE
+        ) WITHOUT ROWID
         '''
     )
-    # Create completions table
     conn.execute(
         '''
-        CREATE TABLE IF NOT EXISTS completions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+        CREATE TABLE IF NOT EXISTS completion_weeks (
             habit_name TEXT,
-            completed_on TEXT,
+            week INTEGER,
+            PRIMARY KEY (habit_name, week),
             FOREIGN KEY (habit_name) REFERENCES habits(name) ON DELETE CASCADE
-        )
+        ) WITHOUT ROWID
+        '''
+    )
+    day_ord = _DAY_ORD_SQL.format(col="NEW.completed_on")
+    conn.execute(
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_completion_periods
+        AFTER INSERT ON completions
+        BEGIN
+            INSERT OR IGNORE INTO completion_days VALUES (NEW.habit_name, {day_ord});
+            INSERT OR IGNORE INTO completion_weeks VALUES (NEW.habit_name, ({day_ord} - 1) / 7);
+        END
         '''
     )
-    conn.commit()
+    # Fill the tables from completions logged before they existed
+    day_ord = _DAY_ORD_SQL.format(col="completed_on")
+    if "completion_days" not in existing:
+        conn.execute(
+            f"INSERT OR IGNORE INTO completion_days "
+            f"SELECT habit_name, {day_ord} FROM completions"
+        )
+    if "completion_weeks" not in existing:
+        conn.execute(
+            f"INSERT OR IGNORE INTO completion_weeks "
+            f"SELECT habit_name, ({day_ord} - 1) / 7 FROM completions"
+        )
 
 
-def add_habit_db(name, description, schedule, created_on):
+def add_habit_db(name, description, schedule, created_on, commit=True):
     """
     Insert a new habit into the database.
+    Pass commit=False inside transaction() to batch several inserts
+    and commit once.
     Raises QueryError on failure.
     """
     conn = None
-    try:
-        # Validate inputs
-        if not name or name.strip() == "":
-            raise ValueError("Name can't be empty")
-        if schedule not in ("daily", "weekly"):
-            raise ValueError("Schedule must be daily or weekly")
+    with _write_lock:
+        try:
+            # Validate inputs
+            if not name or name.strip() == "":
+                raise ValueError("Name can't be empty")
+            if schedule not in ("daily", "weekly"):
+                raise ValueError("Schedule must be daily or weekly")
 
-        conn = connect_db()
-        conn.execute(
-            "INSERT INTO habits VALUES (?, ?, ?, ?)",
-            (name, description, schedule, created_on.isoformat())
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        if conn:
-            conn.rollback()
-        raise QueryError(f"Habit '{name}' already exists")
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        raise QueryError(f"Failed to add habit: {e}")
+            conn = connect_db()
+            conn.execute(
+                "INSERT INTO habits VALUES (?, ?, ?, ?)",
+                (name, description, schedule, created_on.isoformat())
+            )
+            if commit:
+                conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            if conn and commit:
+                conn.rollback()
+            raise QueryError(f"Habit '{name}' already exists")
+        except Exception as e:
+            if conn and commit:
+                conn.rollback()
+            raise QueryError(f"Failed to add habit: {e}")
+
+
+# Habit columns, with created_on converted to a datetime by the driver
+_HABIT_COLUMNS = 'name, description, schedule, created_on AS "created_on [timestamp]"'
 
 
 def get_habit_db(name):
     """
-    Retrieve a habit by name. Returns dict or None.
+    Retrieve a habit by name. Returns a sqlite3.Row or None.
     """
     conn = None
     try:
         conn = connect_db()
         cursor = conn.execute(
-            "SELECT * FROM habits WHERE name = ?", (name,)
+            f"SELECT {_HABIT_COLUMNS} FROM habits WHERE name = ?", (name,)
         )
-        row = cursor.fetchone()
-        if row:
-            return dict(row)
-        return None
+        return cursor.fetchone()
     except Exception as e:
         raise QueryError(f"Failed to get habit: {e}")
 
 
-def delete_habit_db(name):
+def habit_exists_db(name):
     """
-    Delete a habit by name. Returns True if deleted.
+    Return True if a habit with this name exists.
     """
-    conn = None
     try:
         conn = connect_db()
         cursor = conn.execute(
-            "DELETE FROM habits WHERE name = ?", (name,)
+            "SELECT 1 FROM habits WHERE name = ? LIMIT 1", (name,)
         )
-        conn.commit()
-        return cursor.rowcount > 0
+        return cursor.fetchone() is not None
     except Exception as e:
-        if conn:
-            conn.rollback()
-        raise QueryError(f"Failed to delete habit: {e}")
+        raise QueryError(f"Failed to check habit: {e}")
+
+
+def delete_habit_db(name):
+    """
+    Delete a habit by name. Returns True if deleted.
+    """
+    conn = None
+    with _write_lock:
+        try:
+            conn = connect_db()
+            cursor = conn.execute(
+                "DELETE FROM habits WHERE name = ?", (name,)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            raise QueryError(f"Failed to delete habit: {e}")
 
 
 def add_completion_db(habit_name, completed_on):
@@ -134,22 +294,65 @@ def add_completion_db(habit_name, completed_on):
     Log a completion for a habit.
     """
     conn = None
-    try:
-        conn = connect_db()
-        conn.execute(
-            "INSERT INTO completions (habit_name, completed_on) VALUES (?, ?)",
-            (habit_name, completed_on.isoformat())
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        if conn:
-            conn.rollback()
-        raise QueryError(f"Completion already exists for '{habit_name}' at {completed_on}")
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        raise QueryError(f"Failed to log completion: {e}")
+    with _write_lock:
+        try:
+            conn = connect_db()
+            conn.execute(
+                "INSERT INTO completions (habit_name, completed_on) VALUES (?, ?)",
+                (habit_name, completed_on.isoformat())
+            )
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            if conn:
+                conn.rollback()
+            raise QueryError(f"Completion already exists for '{habit_name}' at {completed_on}")
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            raise QueryError(f"Failed to log completion: {e}")
+
+
+def add_completions_bulk_db(rows, commit=True):
+    """
+    Log many completions in one transaction.
+    rows is a list of (habit_name, completed_on_iso) tuples.
+    Pass commit=False inside transaction() to commit together with other writes.
+    """
+    conn = None
+    with _write_lock:
+        try:
+            conn = connect_db()
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO completions (habit_name, completed_on) VALUES (?, ?)",
+                rows
+            )
+            if commit:
+                conn.commit()
+            return True
+        except Exception as e:
+            if conn and commit:
+                conn.rollback()
+            raise QueryError(f"Failed to log completions: {e}")
+
+
+def clear_all_db():
+    """
+    Delete every habit and completion (the stored days/weeks go with them).
+    """
+    conn = None
+    with _write_lock:
+        try:
+            conn = connect_db()
+            conn.execute("DELETE FROM completions")
+            conn.execute("DELETE FROM habits")
+            conn.commit()
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            raise QueryError(f"Failed to clear database: {e}")
 
 
 def get_completions_db(habit_name):
@@ -159,11 +362,13 @@ def get_completions_db(habit_name):
     conn = None
     try:
         conn = connect_db()
+        # The column hint converts rows from databases created with a TEXT column too
         cursor = conn.execute(
-            "SELECT completed_on FROM completions WHERE habit_name = ? ORDER BY completed_on DESC",
+            'SELECT completed_on AS "completed_on [timestamp]" FROM completions '
+            'WHERE habit_name = ? ORDER BY completed_on DESC',
             (habit_name,)
         )
-        return [datetime.datetime.fromisoformat(row[0]) for row in cursor.fetchall()]
+        return [row[0] for row in cursor]
     except Exception as e:
         raise QueryError(f"Failed to get completions: {e}")
 
@@ -172,27 +377,125 @@ def get_completions_in_range_db(habit_name, start_date, end_date):
     """
     Return list of completion datetimes for a habit within [start_date, end_date].
     """
+    # Compare the raw ISO strings (no date() wrapper) so the index can be used
+    if isinstance(start_date, datetime.datetime):
+        start_date = start_date.date()
+    if isinstance(end_date, datetime.datetime):
+        end_date = end_date.date()
+    day_after_end = end_date + datetime.timedelta(days=1)
+
     conn = connect_db()
     cursor = conn.execute(
-        "SELECT completed_on FROM completions "
-        "WHERE habit_name = ? AND date(completed_on) BETWEEN ? AND ? "
-        "ORDER BY completed_on DESC",
-        (habit_name, start_date.isoformat(), end_date.isoformat())
+        'SELECT completed_on AS "completed_on [timestamp]" FROM completions '
+        'WHERE habit_name = ? AND completed_on >= ? AND completed_on < ? '
+        'ORDER BY completed_on DESC',
+        (habit_name, start_date.isoformat(), day_after_end.isoformat())
     )
-    return [datetime.datetime.fromisoformat(r[0]) for r in cursor.fetchall()]
+    return [r[0] for r in cursor]
+
+
+def get_last_completion_db(habit_name):
+    """
+    Return the newest completion datetime for a habit, or None.
+    """
+    try:
+        conn = connect_db()
+        cursor = conn.execute(
+            'SELECT MAX(completed_on) AS "last [timestamp]" FROM completions WHERE habit_name = ?',
+            (habit_name,)
+        )
+        return cursor.fetchone()[0]
+    except Exception as e:
+        raise QueryError(f"Failed to get last completion: {e}")
+
+
+def get_completion_days_db(habit_name):
+    """
+    Return the distinct days (as ordinals) a habit was completed, newest first.
+    """
+    try:
+        conn = connect_db()
+        cursor = conn.execute(
+            "SELECT day_ord FROM completion_days WHERE habit_name = ? ORDER BY day_ord DESC",
+            (habit_name,)
+        )
+        return [row[0] for row in cursor]
+    except Exception as e:
+        raise QueryError(f"Failed to get completion days: {e}")
+
+
+def get_completion_weeks_db(habit_name):
+    """
+    Return the distinct week numbers a habit was completed in, newest first.
+    """
+    try:
+        conn = connect_db()
+        cursor = conn.execute(
+            "SELECT week FROM completion_weeks WHERE habit_name = ? ORDER BY week DESC",
+            (habit_name,)
+        )
+        return [row[0] for row in cursor]
+    except Exception as e:
+        raise QueryError(f"Failed to get completion weeks: {e}")
+
+
+def get_completion_counts_in_range_db(start_date, end_date):
+    """
+    Return {habit_name: completion count} for completions within [start_date, end_date].
+    Habits with no completions in the range are left out.
+    """
+    if isinstance(start_date, datetime.datetime):
+        start_date = start_date.date()
+    if isinstance(end_date, datetime.datetime):
+        end_date = end_date.date()
+    day_after_end = end_date + datetime.timedelta(days=1)
+
+    try:
+        conn = connect_db()
+        cursor = conn.execute(
+            "SELECT habit_name, COUNT(*) FROM completions "
+            "WHERE completed_on >= ? AND completed_on < ? "
+            "GROUP BY habit_name",
+            (start_date.isoformat(), day_after_end.isoformat())
+        )
+        return {row[0]: row[1] for row in cursor}
+    except Exception as e:
+        raise QueryError(f"Failed to count completions: {e}")
+
+
+def get_completions_checksum_db():
+    """
+    Return (row count, newest completed_on) for the completions table.
+    If this hasn't changed, no completion has been added or removed.
+    """
+    try:
+        conn = connect_db()
+        cursor = conn.execute("SELECT COUNT(*), MAX(completed_on) FROM completions")
+        return tuple(cursor.fetchone())
+    except Exception as e:
+        raise QueryError(f"Failed to check completions: {e}")
+
+
+def analytics_cache_path():
+    """
+    Path of the streak cache file next to the database, or None for ':memory:'.
+    """
+    if DB_NAME == ":memory:":
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), ANALYTICS_CACHE_NAME)
 
 
 def get_all_habits_db():
     """
-    Return all habits as list of dicts, newest first.
+    Return all habits as a list of sqlite3.Row objects, newest first.
     """
     conn = None
     try:
         conn = connect_db()
         cursor = conn.execute(
-            "SELECT * FROM habits ORDER BY created_on DESC"
+            f"SELECT {_HABIT_COLUMNS} FROM habits ORDER BY created_on DESC"
         )
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
     except Exception as e:
         raise QueryError(f"Failed to get habits: {e}")
 
@@ -101,10 +101,8 @@ class HabitController:
         if not habit:
             raise HabitNotFoundError(f"Habit '{name}' not found")
 
-        # Get completions and calculate streaks
-        completions = self.manager.get_completions(name)
-        current_streak = analytics.get_current_streak_for_habit(habit, completions)
-        longest_streak = analytics.get_longest_streak_for_habit(habit, completions)
+        # Get streak stats (cached until a completion is added)
+        current_streak, longest_streak, last_completion = self.manager.get_streak_summary(habit)
         
         # Format the output
         lines = [f"Habit: {habit.name} ({habit.schedule})"]
@@ -112,8 +110,8 @@ class HabitController:
         lines.append(f"Longest Streak: {longest_streak} {habit.schedule} completion(s)")
         
         # Add last completion info
-        if completions:
-            last_completion = max(completions).strftime("%Y-%m-%d %H:%M")
+        if last_completion:
+            last_completion = last_completion.strftime("%Y-%m-%d %H:%M")
             lines.append(f"Last completed: {last_completion}")
         else:
             lines.append("No completions recorded yet")
@@ -127,17 +125,14 @@ class HabitController:
         if not all_habits:
             return "No habits defined to calculate streaks."
             
-        # Get all completions
-        all_completions = {}
-        for habit in all_habits:
-            completions = self.manager.get_completions(habit.name)
-            all_completions[habit.name] = completions
+        # Get streak stats for all habits (cached until a completion is added)
+        summaries = self.manager.get_streak_summaries(all_habits)
         
-        # Calculate longest streak for each habit
+        # Collect the longest streak for each habit
         # This part took me a while to figure out
         habit_streaks = []
         for habit in all_habits:
-            streak = analytics.get_longest_streak_for_habit(habit, all_completions[habit.name])
+            streak = summaries[habit.name][1]
             
             # Store as tuples to keep track of everything
             habit_streaks.append((habit.name, streak, habit.schedule))
@@ -184,16 +179,12 @@ class HabitController:
         end_date = datetime.date.today()
         start_date = end_date - datetime.timedelta(days=days)
         
-        # Get completions for all habits in the date range
-        all_completions = {}
-        for habit in all_habits:
-            completions = self.manager.get_completions_in_range(
-                habit.name, start_date, end_date)
-            all_completions[habit.name] = completions
+        # Count completions for all habits in the date range with one query
+        counts = self.manager.get_completion_counts_in_range(start_date, end_date)
             
         # Find struggling habits
         struggling = analytics.find_struggling_habits(
-            all_habits, all_completions, start_date, end_date)
+            all_habits, period_start=start_date, period_end=end_date, counts=counts)
         
         if not struggling:
             return f"No struggling habits in the last {days} days."
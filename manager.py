@@ -1,6 +1,9 @@
 # manager.py - DataManager for Habit Tracker App
 import datetime
+import json
+import os
 import database
+import analytics
 from habit import Habit
 
 # Error for when a habit isn't found
@@ -14,15 +17,20 @@ class DataManager:
         Set up the data manager.
 
         """
+        # Habits by name, so repeated lookups don't hit the database
+        self._habit_cache = {}
+        # True once get_all_habits has loaded every habit into the cache
+        self._cache_loaded = False
+        # Streak summaries, also saved to disk (see get_streak_summaries)
+        self._streak_store = None
+
         # Ensure database tables exist
         database.initialize_database()
 
         if skip_predefined:
             # TEST MODE: clear data so tests start with no habits
-            conn = database.connect_db()
-            conn.execute("DELETE FROM completions")
-            conn.execute("DELETE FROM habits")
-            conn.commit()
+            database.clear_all_db()
+            self._invalidate_streak_store()
         else:
             # NORMAL MODE: load example habits
             self.load_predefined_habits()
@@ -60,17 +68,42 @@ class DataManager:
                     dates.append(completion_date)
                 example_completions[habit["name"]] = dates
 
-        # Add each example habit if it doesn't exist
-        for habit in example_habits:
-            try:
-                if not self.get_habit(habit["name"]):
-                    self.add_habit(habit["name"], habit["description"], habit["schedule"])
-                    # Use log_completion alias to record completions
-                    if habit["name"] in example_completions:
-                        for date in example_completions[habit["name"]]:
-                            self.log_completion(habit["name"], date)
-            except Exception as e:
-                print(f"Couldn't add example habit {habit['name']}: {e}")
+        # Skip examples that are already in the database (one query for all)
+        try:
+            existing = {row["name"] for row in database.get_all_habits_db()}
+        except database.QueryError as e:
+            print(f"Couldn't check existing habits: {e}")
+            return
+
+        # Add the missing example habits and their completions in one transaction.
+        # It holds the write lock, so no other thread can commit or roll back
+        # the shared connection halfway through.
+        try:
+            with database.transaction():
+                added = []
+                for habit in example_habits:
+                    if habit["name"] in existing:
+                        continue
+                    try:
+                        # Own timestamp per habit so listings keep a stable newest-first order
+                        created = datetime.datetime.now()
+                        database.add_habit_db(habit["name"], habit["description"], habit["schedule"],
+                                              created, commit=False)
+                        added.append(habit["name"])
+                    except Exception as e:
+                        print(f"Couldn't add example habit {habit['name']}: {e}")
+
+                # Collect completions for the new habits so they can be inserted in one go
+                completion_rows = [
+                    (name, date.isoformat())
+                    for name in added
+                    for date in example_completions.get(name, [])
+                ]
+                if completion_rows:
+                    database.add_completions_bulk_db(completion_rows, commit=False)
+        except Exception as e:
+            # The rollback also drops the example habits added above
+            print(f"Couldn't add example completions, so the example habits weren't saved either: {e}")
 
     def add_habit(self, name, description, schedule):
         """Add a new habit"""
@@ -80,46 +113,91 @@ class DataManager:
             raise ValueError(f"Schedule must be 'daily' or 'weekly'")
 
         created = datetime.datetime.now()
-        database.add_habit_db(name, description, schedule, created)
+        try:
+            database.add_habit_db(name, description, schedule, created)
+        except database.QueryError:
+            self._clear_habit_cache()
+            raise
+        self._habit_cache[name] = Habit(name, description, schedule, created_on=created)
         return True
 
+    def _clear_habit_cache(self):
+        """Forget all cached habits"""
+        self._habit_cache.clear()
+        self._cache_loaded = False
+
+    def _require_habit(self, name):
+        """Raise HabitNotFoundError unless the habit exists"""
+        if name in self._habit_cache:
+            return
+        # If every habit is cached, a miss means it doesn't exist
+        if self._cache_loaded or not database.habit_exists_db(name):
+            raise HabitNotFoundError(f"Habit '{name}' not found")
+
+    @staticmethod
+    def _habit_from_row(row):
+        """Build a Habit from a database row (created_on is already a datetime)"""
+        return Habit(
+            name=row["name"],
+            description=row["description"],
+            schedule=row["schedule"],
+            created_on=row["created_on"]
+        )
+
     def get_habit(self, name):
         """Get a habit by name"""
-        data = database.get_habit_db(name)
+        if name in self._habit_cache:
+            return self._habit_cache[name]
+        if self._cache_loaded:
+            # Every habit is cached, so it doesn't exist
+            return None
+
+        try:
+            data = database.get_habit_db(name)
+        except database.QueryError:
+            self._clear_habit_cache()
+            raise
         if data:
-            return Habit(
-                name=data["name"],
-                description=data["description"],
-                schedule=data["schedule"],
-                created_on=datetime.datetime.fromisoformat(data["created_on"])
-            )
+            habit = self._habit_from_row(data)
+            self._habit_cache[name] = habit
+            return habit
         return None
 
     def get_all_habits(self):
         """Get all habits"""
-        data = database.get_all_habits_db()
-        habits = []
-        for row in data:
-            habits.append(Habit(
-                name=row["name"],
-                description=row["description"],
-                schedule=row["schedule"],
-                created_on=datetime.datetime.fromisoformat(row["created_on"])
-            ))
+        if self._cache_loaded:
+            # Keep the database order: newest first
+            return sorted(self._habit_cache.values(), key=lambda h: h.created_on, reverse=True)
+
+        try:
+            data = database.get_all_habits_db()
+        except database.QueryError:
+            self._clear_habit_cache()
+            raise
+        habits = [self._habit_from_row(row) for row in data]
+        # Warm the cache with every habit
+        self._habit_cache = {h.name: h for h in habits}
+        self._cache_loaded = True
         return habits
 
     def delete_habit(self, name):
         """Delete a habit"""
-        return database.delete_habit_db(name)
+        try:
+            deleted = database.delete_habit_db(name)
+        except database.QueryError:
+            self._clear_habit_cache()
+            raise
+        self._habit_cache.pop(name, None)
+        self._invalidate_streak_store()
+        return deleted
 
     def add_completion(self, habit_name, completion_time=None):
         """Log that a habit was completed"""
-        habit = self.get_habit(habit_name)
-        if not habit:
-            raise HabitNotFoundError(f"Habit '{habit_name}' not found")
+        self._require_habit(habit_name)
         if completion_time is None:
             completion_time = datetime.datetime.now()
         database.add_completion_db(habit_name, completion_time)
+        self._invalidate_streak_store()
         return True
 
     def log_completion(self, habit_name, completion_time=None):
@@ -130,16 +208,135 @@ class DataManager:
 
     def get_completions(self, habit_name):
         """Get all times a habit was completed"""
-        habit = self.get_habit(habit_name)
-        if not habit:
-            raise HabitNotFoundError(f"Habit '{habit_name}' not found")
+        self._require_habit(habit_name)
         return database.get_completions_db(habit_name)
 
+    def _streak_store_key(self):
+        """Key that changes whenever saved streaks could be out of date"""
+        # Current streaks also depend on today's date
+        return list(database.get_completions_checksum_db()) + [datetime.date.today().isoformat()]
+
+    def _load_streak_store(self):
+        """
+        Get the streak store. The in-memory copy is kept until a write clears
+        it or the day changes; the cache file is only checked when starting cold.
+        """
+        today = datetime.date.today().isoformat()
+        if self._streak_store is not None and self._streak_store["date"] == today:
+            return self._streak_store
+
+        self._streak_store = {"date": today, "key": None, "streaks": {}}
+        path = database.analytics_cache_path()
+        if not path:
+            return self._streak_store
+
+        key = self._streak_store_key()
+        self._streak_store["key"] = key
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("key") == key:
+                    self._streak_store["streaks"] = {
+                        name: (current, longest,
+                               datetime.datetime.fromisoformat(last) if last else None)
+                        for name, (current, longest, last) in saved["streaks"].items()
+                    }
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # A broken cache file just means recalculating
+                print(f"Ignoring analytics cache: {e}")
+        return self._streak_store
+
+    def _save_streak_store(self):
+        """Write the streak store to disk as JSON (atomically, via a temp file)"""
+        path = database.analytics_cache_path()
+        if not path or self._streak_store["key"] is None:
+            return
+        saved = {
+            "key": self._streak_store["key"],
+            "streaks": {
+                name: [current, longest, last.isoformat() if last else None]
+                for name, (current, longest, last) in self._streak_store["streaks"].items()
+            },
+        }
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Couldn't save analytics cache: {e}")
+
+    def _invalidate_streak_store(self):
+        """Forget saved streaks after the data changed"""
+        self._streak_store = None
+        path = database.analytics_cache_path()
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_streak_summaries(self, habits):
+        """
+        Get {habit name: (current streak, longest streak, last completion)}.
+
+        Results are reused (also across restarts, via a cache file next to
+        the database) until a completion is added or a habit is deleted.
+        """
+        store = self._load_streak_store()
+        streaks = store["streaks"]
+        missing = [h for h in habits if h.name not in streaks]
+        for habit in missing:
+            streaks[habit.name] = self._compute_streak_summary(habit)
+        if missing:
+            self._save_streak_store()
+        return {h.name: streaks[h.name] for h in habits}
+
+    def _compute_streak_summary(self, habit):
+        """
+        Work out (current, longest, last completion) from the stored distinct
+        days/weeks, without loading every completion.
+        """
+        last_completion = self.get_last_completion(habit.name)
+        if last_completion is None:
+            return (0, 0, None)
+        if habit.schedule == "weekly":
+            keys = self.get_completion_weeks(habit.name)
+        else:
+            keys = self.get_completion_days(habit.name)
+        current, longest = analytics.streaks_from_periods(
+            habit.schedule, keys, last_completion.date())
+        return (current, longest, last_completion)
+
+    def get_streak_summary(self, habit):
+        """Get (current streak, longest streak, last completion) for one habit"""
+        return self.get_streak_summaries([habit])[habit.name]
+
+    def get_last_completion(self, habit_name):
+        """Get the newest completion time for a habit, or None"""
+        self._require_habit(habit_name)
+        return database.get_last_completion_db(habit_name)
+
+    def get_completion_days(self, habit_name):
+        """Get the distinct days (ordinals) a habit was done, newest first"""
+        self._require_habit(habit_name)
+        return database.get_completion_days_db(habit_name)
+
+    def get_completion_weeks(self, habit_name):
+        """Get the distinct week numbers a habit was done in, newest first"""
+        self._require_habit(habit_name)
+        return database.get_completion_weeks_db(habit_name)
+
+    def get_completion_counts_in_range(self, start_date, end_date):
+        """Count completions per habit between two dates in one query"""
+        if end_date < start_date:
+            raise ValueError("End date must be after start date")
+        return database.get_completion_counts_in_range_db(start_date, end_date)
+
     def get_completions_in_range(self, habit_name, start_date, end_date):
         """Get completions between two dates"""
         if end_date < start_date:
             raise ValueError("End date must be after start date")
-        habit = self.get_habit(habit_name)
-        if not habit:
-            raise HabitNotFoundError(f"Habit '{habit_name}' not found")
+        self._require_habit(habit_name)
         return database.get_completions_in_range_db(habit_name, start_date, end_date)
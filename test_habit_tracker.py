@@ -1,9 +1,14 @@
 import pytest
 import datetime
+import os
+import sqlite3
+import subprocess
+import sys
 
 import database
 from habit import Habit
 import analytics
+import analytics_jit
 from manager import DataManager, HabitNotFoundError
 from habit_controller import HabitController, ValidationError
 
@@ -54,6 +59,30 @@ def test_manager_add_get_delete_habit(manager):
     assert manager.get_habit('Run') is None
 
 
+def test_manager_predefined_habits_newest_first():
+    DataManager(skip_predefined=True)
+    m = DataManager()
+    names = [h.name for h in m.get_all_habits()]
+    assert names == ['Weekly Review', 'Meditate', 'Read', 'Exercise', 'Drink Water']
+    assert len(m.get_completions('Weekly Review')) == 4
+
+
+def test_manager_habit_cache(manager):
+    manager.add_habit('Cook', 'Cook dinner', 'daily')
+    assert manager.get_habit('Cook') is manager.get_habit('Cook')
+    assert [h.name for h in manager.get_all_habits()] == ['Cook']
+    manager.add_habit('Plan', '', 'weekly')
+    assert [h.name for h in manager.get_all_habits()] == ['Plan', 'Cook']
+    assert manager.delete_habit('Cook')
+    assert manager.get_habit('Cook') is None
+    assert [h.name for h in manager.get_all_habits()] == ['Plan']
+    # A failed insert clears the cache
+    with pytest.raises(database.QueryError):
+        manager.add_habit('Plan', '', 'weekly')
+    assert manager._habit_cache == {}
+    assert manager.get_habit('Plan').name == 'Plan'
+
+
 def test_manager_log_and_get_completions(manager):
     manager.add_habit('Read', 'Read books', 'daily')
     now = datetime.datetime.now()
@@ -62,6 +91,124 @@ def test_manager_log_and_get_completions(manager):
     assert len(completions) == 1
     assert completions[0].date() == now.date()
 
+
+def test_manager_completions_unknown_habit(manager):
+    assert not database.habit_exists_db('Ghost')
+    with pytest.raises(HabitNotFoundError):
+        manager.log_completion('Ghost')
+    with pytest.raises(HabitNotFoundError):
+        manager.get_completions('Ghost')
+
+
+def test_manager_completions_in_range_includes_end_day(manager):
+    manager.add_habit('Stretch', '', 'daily')
+    start = datetime.date(2025, 3, 1)
+    end = datetime.date(2025, 3, 7)
+    manager.log_completion('Stretch', datetime.datetime(2025, 2, 28, 23, 59))
+    manager.log_completion('Stretch', datetime.datetime(2025, 3, 1, 0, 0))
+    manager.log_completion('Stretch', datetime.datetime(2025, 3, 7, 23, 59))
+    manager.log_completion('Stretch', datetime.datetime(2025, 3, 8, 0, 0))
+    completions = manager.get_completions_in_range('Stretch', start, end)
+    assert [c.day for c in completions] == [7, 1]
+
+
+def test_manager_streak_summary_invalidated_on_completion(manager):
+    manager.add_habit('Journal', '', 'daily')
+    h = manager.get_habit('Journal')
+    assert manager.get_streak_summary(h) == (0, 0, None)
+    when = make_dates([0])[0]
+    manager.log_completion('Journal', when)
+    assert manager.get_streak_summary(h) == (1, 1, when)
+
+
+def test_streak_summaries_saved_next_to_file_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / 'habits.db'))
+    first = DataManager()
+    h = first.get_habit('Drink Water')
+    expected = first.get_streak_summary(h)
+    path = database.analytics_cache_path()
+    assert path == str(tmp_path / 'analytics_cache.json')
+
+    # A fresh manager reads the saved summary instead of recomputing it
+    second = DataManager()
+    monkeypatch.setattr(second, '_compute_streak_summary',
+                        lambda habit: pytest.fail('summary was recomputed'))
+    assert second.get_streak_summary(h) == expected
+
+    # A completion added behind the cache's back changes the key
+    database.add_completion_db('Drink Water', make_dates([3])[0])
+    third = DataManager()
+    recomputed = []
+    compute = third._compute_streak_summary
+    monkeypatch.setattr(third, '_compute_streak_summary',
+                        lambda habit: recomputed.append(habit.name) or compute(habit))
+    completions = third.get_completions('Drink Water')
+    assert third.get_streak_summary(h) == (
+        analytics.get_current_streak_for_habit(h, completions),
+        analytics.get_longest_streak_for_habit(h, completions),
+        completions[0])
+    assert third.get_streak_summary(h) != expected
+    assert recomputed == ['Drink Water']
+
+
+def test_manager_longest_streak_from_stored_weeks(manager):
+    manager.add_habit('Review', '', 'weekly')
+    dates = [datetime.datetime(2020, 12, 21), datetime.datetime(2020, 12, 22),
+             datetime.datetime(2020, 12, 31), datetime.datetime(2021, 1, 4),
+             datetime.datetime(2021, 1, 25)]
+    for d in dates:
+        manager.log_completion('Review', d)
+    h = manager.get_habit('Review')
+    assert len(manager.get_completion_weeks('Review')) == 4
+    # The last completion is years old, so only the longest streak is left
+    assert manager.get_streak_summary(h) == (0, 3, dates[-1])
+    assert analytics.get_longest_streak_for_habit(h, dates) == 3
+
+
+def test_manager_daily_streak_summary_matches_analytics(manager):
+    manager.add_habit('Walk', 'Walk outside', 'daily')
+    for d in make_dates([0, 0, 1, 2, 4, 5]):
+        manager.log_completion('Walk', d)
+    h = manager.get_habit('Walk')
+    completions = manager.get_completions('Walk')
+    current, longest, _ = manager.get_streak_summary(h)
+    assert current == analytics.get_current_streak_for_habit(h, completions) == 3
+    assert longest == analytics.get_longest_streak_for_habit(h, completions) == 3
+    manager.add_habit('Stale', '', 'daily')
+    manager.log_completion('Stale', make_dates([3])[0])
+    assert manager.get_streak_summary(manager.get_habit('Stale'))[:2] == (0, 1)
+
+
+def test_connect_db_reconnects_when_db_name_changes(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / 'first.db'))
+    first = database.connect_db()
+    assert database.connect_db() is first
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / 'second.db'))
+    second = database.connect_db()
+    assert second is not first
+    # The old connection was closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute("SELECT 1")
+
+
+def test_transaction_rolls_back_on_error(manager):
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.add_habit_db('Nap', '', 'daily', datetime.datetime.now(), commit=False)
+            database.add_completions_bulk_db([('Nap', datetime.datetime.now().isoformat())],
+                                             commit=False)
+            raise RuntimeError('stop')
+    assert not database.habit_exists_db('Nap')
+    assert database.get_completion_days_db('Nap') == []
+
+
+def test_add_completions_bulk_db(manager):
+    manager.add_habit('Swim', 'Swim laps', 'daily')
+    now = datetime.datetime.now()
+    rows = [('Swim', (now - datetime.timedelta(days=i)).isoformat()) for i in range(3)]
+    assert database.add_completions_bulk_db(rows)
+    assert len(manager.get_completions('Swim')) == 3
+
 # Analytics tests
 def make_dates(days):
     today = datetime.date.today()
@@ -83,6 +230,13 @@ def test_calculate_streak_weekly():
     assert streak == 3
 
 
+def test_longest_weekly_streak_across_new_year():
+    h = Habit('Review', '', 'weekly')
+    # ISO weeks 2020-W52, 2020-W53 and 2021-W01
+    dates = [datetime.datetime(2020, 12, 21), datetime.datetime(2020, 12, 31), datetime.datetime(2021, 1, 4)]
+    assert analytics.get_longest_streak_for_habit(h, dates) == 3
+
+
 def test_get_current_and_longest_streak_for_habit():
     h = Habit('X', 'desc', 'daily')
     dates = make_dates([0, 1, 2, 5, 6])
@@ -92,6 +246,41 @@ def test_get_current_and_longest_streak_for_habit():
     assert longest == 3
 
 
+@pytest.mark.parametrize('have_numba', [True, False])
+def test_daily_streaks_very_long_history(monkeypatch, have_numba):
+    # Without Numba the NumPy fallback handles histories this long
+    monkeypatch.setattr(analytics_jit, 'HAVE_NUMBA', analytics_jit.HAVE_NUMBA and have_numba)
+    h = Habit('Years', 'desc', 'daily')
+    dates = make_dates(list(range(700)) + list(range(701, 1601)))
+    assert analytics.get_current_streak_for_habit(h, dates) == 700
+    assert analytics.get_longest_streak_for_habit(h, dates) == 900
+    # Oldest-first input is sorted as well
+    assert analytics.get_current_streak_for_habit(h, dates[::-1]) == 700
+
+
+def test_numba_not_imported_with_analytics():
+    # Numba is slow to import, so it waits until a long history needs it
+    code = "import sys, analytics; assert 'numba' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_streaks_from_periods():
+    today = datetime.date.today()
+    days = [d.toordinal() for d in make_dates([0, 1, 2, 5, 6, 7, 8])]
+    assert analytics.streaks_from_periods('daily', days, today) == (3, 4)
+    # An old last completion still has a longest streak but no current one
+    stale = today - datetime.timedelta(days=2)
+    assert analytics.streaks_from_periods('daily', days, stale) == (0, 4)
+
+
+@pytest.mark.parametrize('have_numba', [True, False])
+def test_streaks_from_periods_very_long_history(monkeypatch, have_numba):
+    monkeypatch.setattr(analytics_jit, 'HAVE_NUMBA', analytics_jit.HAVE_NUMBA and have_numba)
+    days = [d.toordinal() for d in make_dates(list(range(700)) + list(range(701, 1601)))]
+    assert analytics.streaks_from_periods('daily', days, datetime.date.today()) == (700, 900)
+
+
 def test_get_habits_by_periodicity_valid():
     h1 = Habit('A', '', 'daily')
     h2 = Habit('B', '', 'weekly')
@@ -118,6 +307,21 @@ def test_find_struggling_habits():
     assert res[0][0] == 'D' or res[0][0] == 'W'
     assert all(isinstance(x[1], int) for x in res)
 
+
+def test_find_struggling_habits_with_counts(manager):
+    manager.add_habit('D', '', 'daily')
+    manager.add_habit('W', '', 'weekly')
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=6)
+    for d in make_dates(range(5)):
+        manager.log_completion('D', d)
+    habits = manager.get_all_habits()
+    comps = {h.name: manager.get_completions_in_range(h.name, start, today) for h in habits}
+    counts = manager.get_completion_counts_in_range(start, today)
+    assert counts == {'D': 5}
+    assert analytics.find_struggling_habits(habits, period_start=start, period_end=today, counts=counts) == \
+        analytics.find_struggling_habits(habits, comps, start, today)
+
 # Controller tests
 def test_controller_add_habit_and_validation():
     ctrl = HabitController(test_mode=True)